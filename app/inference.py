@@ -5,32 +5,138 @@ Handles model loading and prediction.
 
 import os
 import io
-import base64
+import threading
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 
 # Try to import ultralytics - handle case when it's not installed (Python 3.7)
 try:
+    import cv2  # installed with ultralytics (opencv-python)
     import torch
     from ultralytics import YOLO
+    # Allow TF32 tensor-core matmuls. cuDNN benchmark stays off: micro-batches
+    # (1..CROPDOCTOR_MAX_BATCH) and rect letterboxing give many input shapes, and
+    # each new shape would be autotuned during a live request.
+    torch.set_float32_matmul_precision('high')
     # Fix for PyTorch 2.6+ weights_only default change
     # Add Ultralytics classes to safe globals for model loading
     try:
         from ultralytics.nn.tasks import DetectionModel
         torch.serialization.add_safe_globals([DetectionModel])
     except (ImportError, AttributeError):
-        # If add_safe_globals doesn't exist or import fails, 
-        # we'll handle it in the model loading
+        # If add_safe_globals doesn't exist or import fails,
+        # the torch.load patch below still handles it
         pass
+    # Default torch.load to weights_only=False (trusted local checkpoint).
+    # Patched once per process; the guard avoids wrapping it twice on reload.
+    if not getattr(torch.load, '_weights_only_patched', False):
+        _original_torch_load = torch.load
+        
+        def _load_noverify(*args, **kwargs):
+            kwargs.setdefault('weights_only', False)
+            return _original_torch_load(*args, **kwargs)
+        
+        _load_noverify._weights_only_patched = True
+        torch.load = _load_noverify
     ULTRALYTICS_AVAILABLE = True
 except ImportError:
     ULTRALYTICS_AVAILABLE = False
     YOLO = None  # type: ignore
 
-from app.utils import get_model_path, load_image_from_bytes
-from app.schemas import PredictionItem
+# Numba is optional - the label geometry helper runs as plain NumPy without it
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# PyTurboJPEG is optional - JPEG encoding falls back to Pillow without it
+# (it also needs the libturbojpeg shared library)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _tj = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except (ImportError, OSError, RuntimeError):
+    TURBOJPEG_AVAILABLE = False
+
+from app.utils import get_model_path
+from app.schemas import PredictionItem, construct_model
+
+
+# Colors for different classes (cycle through colors)
+_COLORS = (
+    (255, 0, 0),    # Red
+    (0, 255, 0),    # Green
+    (0, 0, 255),    # Blue
+    (255, 255, 0),  # Yellow
+    (255, 0, 255),  # Magenta
+    (0, 255, 255),  # Cyan
+    (255, 128, 0),  # Orange
+    (128, 0, 255),  # Purple
+)
+
+# Label font (built into OpenCV, resolved once at import)
+_FONT = cv2.FONT_HERSHEY_SIMPLEX if ULTRALYTICS_AVAILABLE else None
+_FONT_SCALE = 0.5
+_FONT_THICKNESS = 1
+
+# Encoders for the annotated image: format -> (MIME type, PIL save options)
+IMAGE_ENCODERS = {
+    "JPEG": ("image/jpeg", {"quality": 85, "optimize": False, "progressive": False}),
+    "WEBP": ("image/webp", {"quality": 85, "method": 4}),
+}
+
+# Per-thread reusable encode buffer (inference runs in worker threads)
+_buffer_tls = threading.local()
+
+
+def _get_encode_buffer() -> io.BytesIO:
+    """
+    Get this thread's reusable BytesIO for image encoding, rewound to the start.
+    
+    Returns:
+        BytesIO buffer positioned at offset 0
+    """
+    buf = getattr(_buffer_tls, 'buf', None)
+    if buf is None:
+        buf = _buffer_tls.buf = io.BytesIO()
+    buf.seek(0)
+    return buf
+
+
+# Export formats for CROPDOCTOR_BACKEND: backend -> (ultralytics format, cached file suffix).
+# The ONNX cache gets its own name: the TensorRT export leaves an FP16 best.onnx
+# behind as its intermediate file, which ONNX Runtime can't feed FP32 input.
+EXPORT_FORMATS = {
+    "trt": ("engine", ".engine"),
+    "onnx": ("onnx", ".fp32.onnx"),
+}
+
+
+def compute_label_boxes(box_coords: np.ndarray, text_widths: np.ndarray, text_heights: np.ndarray) -> np.ndarray:
+    """
+    Compute label background rectangles for all detections at once.
+    
+    Args:
+        box_coords: (N, 4) array of [x1, y1, x2, y2] box coordinates
+        text_widths: (N,) int32 array of label text widths
+        text_heights: (N,) int32 array of label text heights
+        
+    Returns:
+        (N, 4) int32 array of [x1, label_y, x2_bg, y2_bg]
+    """
+    x1 = box_coords[:, 0].astype(np.int32)
+    label_y = np.maximum(box_coords[:, 1].astype(np.int32) - text_heights - 5, 0)
+    return np.stack(
+        (x1, label_y, x1 + text_widths + 10, label_y + text_heights + 5),
+        axis=1
+    ).astype(np.int32)
+
+
+if NUMBA_AVAILABLE:
+    compute_label_boxes = numba.njit(cache=True, fastmath=True)(compute_label_boxes)
 
 
 class ModelInference:
@@ -66,45 +172,110 @@ class ModelInference:
                 "Please train the model first using train/train.py"
             )
         
-        print(f"Loading YOLO model from: {self.model_path.absolute()}")
+        # Use an exported TensorRT/ONNX engine if requested
+        self.backend = os.getenv("CROPDOCTOR_BACKEND", "pt").lower()
+        if self.backend in EXPORT_FORMATS:
+            self.model = self._load_exported_model(self.backend)
+        else:
+            if self.backend != "pt":
+                print(f"WARNING: Unknown CROPDOCTOR_BACKEND '{self.backend}', using PyTorch weights")
+                self.backend = "pt"
+            print(f"Loading YOLO model from: {self.model_path.absolute()}")
+            self.model = YOLO(str(self.model_path))
         
-        # Fix for PyTorch 2.6+ weights_only issue
-        # Patch torch.load to use weights_only=False before loading model
-        import torch
-        original_load = torch.load
+        # Run on the first GPU when available; FP16 needs tensor cores (Volta+).
+        # The ONNX export is FP32, so ONNX Runtime only accepts FP32 input.
+        if torch.cuda.is_available():
+            self.device = 0
+            self.half = torch.cuda.get_device_capability(0)[0] >= 7 and self.backend != "onnx"
+        else:
+            self.device = 'cpu'
+            self.half = False
         
-        def patched_load(*args, **kwargs):
-            # Always set weights_only=False for model loading
-            if 'weights_only' not in kwargs:
-                kwargs['weights_only'] = False
-            return original_load(*args, **kwargs)
+        print("Model loaded successfully!")
         
-        # Apply patch
-        torch.load = patched_load
+        self.warmup()
         
-        try:
-            # Try to add safe globals if method exists
-            try:
-                from ultralytics.nn.tasks import DetectionModel
-                if hasattr(torch.serialization, 'add_safe_globals'):
-                    torch.serialization.add_safe_globals([DetectionModel])
-            except (ImportError, AttributeError):
-                pass
+        # Per-class label color and text size never change for a loaded model;
+        # confidence digits have a fixed width in the Hershey font.
+        # Class names come from the predictor's backend (set up by warmup):
+        # YOLO.names is None for exported .engine/.onnx models.
+        class_names = self.model.predictor.model.names
+        self._class_color = {
+            class_id: _COLORS[class_id % len(_COLORS)]
+            for class_id in class_names
+        }
+        self._class_text_size = {
+            class_id: cv2.getTextSize(f"{name}: 0.99", _FONT, _FONT_SCALE, _FONT_THICKNESS)[0]
+            for class_id, name in class_names.items()
+        }
+    
+    def warmup(self, runs: int = 3):
+        """
+        Run dummy inferences so CUDA initialization and memory-pool growth
+        happen before the first real request.
+        
+        Args:
+            runs: Number of dummy forward passes
+        """
+        dummy = Image.new('RGB', (640, 640), (0, 0, 0))
+        with torch.inference_mode(), torch.autocast('cuda', dtype=torch.float16, enabled=self.half):
+            for _ in range(runs):
+                self.model(dummy, verbose=False, device=self.device, half=self.half)
+        if self.device != 'cpu':
+            torch.cuda.synchronize()
+    
+    def _load_exported_model(self, backend: str):
+        """
+        Load an exported engine for the given backend, exporting it when needed.
+        
+        The exported file is cached next to best.pt (best.engine / best.fp32.onnx) and
+        loaded directly on later startups. It is re-exported when best.pt is newer
+        (e.g. after retraining).
+        
+        Args:
+            backend: Backend name ("trt" or "onnx")
             
-            # Load model with patched torch.load
-            self.model = YOLO(str(self.model_path))
-        finally:
-            # Restore original torch.load after model loading
-            torch.load = original_load
+        Returns:
+            YOLO model wrapping the exported engine (or the PyTorch model if export fails)
+        """
+        export_format, suffix = EXPORT_FORMATS[backend]
+        engine_path = self.model_path.parent / f"{self.model_path.stem}{suffix}"
         
-        print("Model loaded successfully!")
+        is_stale = (
+            not engine_path.exists()
+            or engine_path.stat().st_mtime < self.model_path.stat().st_mtime
+        )
+        if is_stale:
+            print(f"Loading YOLO model from: {self.model_path.absolute()}")
+            pt_model = YOLO(str(self.model_path))
+            print(f"Exporting model to {export_format}...")
+            try:
+                exported = pt_model.export(
+                    format=export_format,
+                    half=(backend == "trt"),
+                    imgsz=640,
+                    dynamic=False
+                )
+                exported_path = Path(exported)
+                if exported_path != engine_path:
+                    exported_path.replace(engine_path)
+            except Exception as e:
+                print(f"WARNING: Export to {export_format} failed ({e}), using PyTorch weights")
+                self.backend = "pt"
+                return pt_model
+        
+        print(f"Loading {export_format} engine from: {engine_path.absolute()}")
+        # Ultralytics dispatches .engine/.onnx files to TensorRT/ONNX Runtime
+        return YOLO(str(engine_path), task="detect")
     
-    def predict(self, image: Image.Image) -> Dict:
+    def predict(self, image: Image.Image, image_format: str = "JPEG") -> Dict:
         """
         Run inference on an image.
         
         Args:
             image: PIL Image object
+            image_format: Encoding for the annotated image ("JPEG" or "WEBP")
             
         Returns:
             Dictionary with prediction results:
@@ -112,149 +283,142 @@ class ModelInference:
                 "disease": str,
                 "confidence": float,
                 "all_predictions": List[PredictionItem],
-                "annotated_image": str (base64-encoded PNG image with bounding boxes)
+                "annotated_image_bytes": bytes (encoded JPEG/WebP image with bounding boxes),
+                "annotated_image_type": str (MIME type of annotated_image_bytes)
             }
         """
+        return self.predict_batch([image], [image_format])[0]
+    
+    def predict_batch(self, images: List[Image.Image], image_formats: List[str]) -> List[Dict]:
+        """
+        Run inference on several images in a single model call.
+        
+        Args:
+            images: List of PIL Image objects
+            image_formats: Encoding for each annotated image ("JPEG" or "WEBP")
+            
+        Returns:
+            List of prediction result dictionaries (same format as predict), in input order
+        """
         # Run YOLO inference
-        # Results is a list of Results objects
-        results = self.model(image, verbose=False)
+        # Results is a list of Results objects, one per image
+        with torch.inference_mode(), torch.autocast('cuda', dtype=torch.float16, enabled=self.half):
+            if self.backend == "pt":
+                results = self.model(images, verbose=False, device=self.device, half=self.half)
+            else:
+                # Exported engines have a static batch size of 1
+                results = [
+                    self.model(image, verbose=False, device=self.device, half=self.half)[0]
+                    for image in images
+                ]
         
-        # Get the first result (single image inference)
-        result = results[0]
+        return [
+            self._process_result(image, result, image_format)
+            for image, result, image_format in zip(images, results, image_formats)
+        ]
+    
+    def _process_result(self, image: Image.Image, result, image_format: str) -> Dict:
+        """
+        Annotate an image and build the prediction dictionary from its YOLO result.
         
+        Args:
+            image: PIL Image object the result was computed on
+            result: Ultralytics Results object for the image
+            image_format: Encoding for the annotated image ("JPEG" or "WEBP")
+            
+        Returns:
+            Dictionary with prediction results (see predict)
+        """
         # Extract predictions
         boxes = result.boxes
         
         # Get all detected classes with confidence scores
         all_predictions = []
         
-        # Create a copy of the image for annotation
-        annotated_image = image.copy()
-        draw = ImageDraw.Draw(annotated_image)
-        
-        # Try to load a font (fallback to default if not available)
-        font = None
-        try:
-            # Try common font paths
-            font_paths = [
-                "/System/Library/Fonts/Helvetica.ttc",  # macOS
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
-                "C:/Windows/Fonts/arial.ttf",  # Windows
-            ]
-            for font_path in font_paths:
-                try:
-                    if os.path.exists(font_path):
-                        font = ImageFont.truetype(font_path, 16)
-                        break
-                except:
-                    continue
-            # Fallback to default font if nothing worked
-            if font is None:
-                font = ImageFont.load_default()
-        except:
-            font = None
+        # Draw on a single NumPy copy of the image (OpenCV rasterizes in C)
+        arr = np.array(image)
         
         if boxes is not None and len(boxes) > 0:
-            # Get class names and confidences
-            class_ids = boxes.cls.cpu().numpy()
-            confidences = boxes.conf.cpu().numpy()
-            box_coords = boxes.xyxy.cpu().numpy()  # Get bounding box coordinates
+            # Copy all detections to the host at once: (N, 6) = [x1, y1, x2, y2, conf, cls]
+            data = boxes.data.detach().cpu().numpy()
+            # Order detections by confidence (highest first)
+            data = data[np.argsort(-data[:, 4], kind='stable')]
+            box_coords = data[:, :4]  # Get bounding box coordinates
+            confidences = data[:, 4]
+            class_ids = data[:, 5].astype(np.int32)
             
             # Get class names from the model
             class_names = result.names
             
-            # Colors for different classes (cycle through colors)
-            colors = [
-                (255, 0, 0),    # Red
-                (0, 255, 0),    # Green
-                (0, 0, 255),    # Blue
-                (255, 255, 0),  # Yellow
-                (255, 0, 255),  # Magenta
-                (0, 255, 255),  # Cyan
-                (255, 128, 0),  # Orange
-                (128, 0, 255),  # Purple
-            ]
+            # Label sizes are precomputed per class at model load
+            text_sizes = [self._class_text_size[c] for c in class_ids.tolist()]
+            text_widths = np.array([size[0] for size in text_sizes], dtype=np.int32)
+            text_heights = np.array([size[1] for size in text_sizes], dtype=np.int32)
+            label_boxes = compute_label_boxes(box_coords, text_widths, text_heights)
             
             # Draw bounding boxes and labels
-            for i, (box, class_id, confidence) in enumerate(zip(box_coords, class_ids, confidences)):
+            for box, label_box, text_height, class_id, confidence in zip(
+                box_coords.astype(np.int32), label_boxes, text_heights, class_ids, confidences
+            ):
                 class_name = class_names[int(class_id)]
-                color = colors[int(class_id) % len(colors)]
+                color = self._class_color[int(class_id)]
                 
                 # Draw bounding box
-                x1, y1, x2, y2 = box
-                draw.rectangle([(x1, y1), (x2, y2)], outline=color, width=3)
-                
-                # Prepare label text
-                label = f"{class_name}: {confidence:.2f}"
-                
-                # Calculate text size and position
-                try:
-                    if font:
-                        # Try textbbox first (PIL 8.0+)
-                        try:
-                            bbox = draw.textbbox((0, 0), label, font=font)
-                            text_width = bbox[2] - bbox[0]
-                            text_height = bbox[3] - bbox[1]
-                        except AttributeError:
-                            # Fallback to textsize (older PIL)
-                            text_width, text_height = draw.textsize(label, font=font)
-                    else:
-                        # Estimate size without font
-                        text_width = len(label) * 6
-                        text_height = 12
-                except:
-                    # Fallback estimation
-                    text_width = len(label) * 6
-                    text_height = 12
+                x1, y1, x2, y2 = box.tolist()
+                cv2.rectangle(arr, (x1, y1), (x2, y2), color, 3)
                 
                 # Draw label background
-                label_y = max(0, y1 - text_height - 5)
-                draw.rectangle(
-                    [(x1, label_y), (x1 + text_width + 10, label_y + text_height + 5)],
-                    fill=color
-                )
+                bg_x1, label_y, bg_x2, bg_y2 = label_box.tolist()
+                cv2.rectangle(arr, (bg_x1, label_y), (bg_x2, bg_y2), color, cv2.FILLED)
                 
-                # Draw label text
-                if font:
-                    draw.text((x1 + 5, label_y + 2), label, fill=(255, 255, 255), font=font)
-                else:
-                    draw.text((x1 + 5, label_y + 2), label, fill=(255, 255, 255))
+                # Draw label text (OpenCV anchors text at the baseline)
+                label = f"{class_name}: {confidence:.2f}"
+                cv2.putText(
+                    arr, label, (x1 + 5, label_y + 2 + int(text_height)),
+                    _FONT, _FONT_SCALE, (255, 255, 255), _FONT_THICKNESS, cv2.LINE_AA
+                )
                 
-                # Create prediction items
+                # Create prediction items (server-generated, so skip validation)
                 all_predictions.append(
-                    PredictionItem(
+                    construct_model(
+                        PredictionItem,
                         class_name=class_name,
                         confidence=float(confidence)
                     )
                 )
             
-            # Sort by confidence (highest first)
-            all_predictions.sort(key=lambda x: x.confidence, reverse=True)
-            
             # Get primary prediction (highest confidence)
-            primary = all_predictions[0]
-            disease = primary.class_name
-            confidence = primary.confidence
+            disease = class_names[int(class_ids[0])]
+            confidence = float(confidences[0])
             
         else:
             # No detections - return default response
             disease = "No Disease Detected"
             confidence = 0.0
             all_predictions = [
-                PredictionItem(class_name="No Disease Detected", confidence=0.0)
+                construct_model(PredictionItem, class_name="No Disease Detected", confidence=0.0)
             ]
         
-        # Convert annotated image to base64 string
-        img_buffer = io.BytesIO()
-        annotated_image.save(img_buffer, format='PNG')
-        img_str = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-        annotated_image_base64 = f"data:image/png;base64,{img_str}"
+        # Encode annotated image
+        if image_format not in IMAGE_ENCODERS:
+            image_format = "JPEG"
+        mime_type, save_options = IMAGE_ENCODERS[image_format]
+        if image_format == "JPEG" and TURBOJPEG_AVAILABLE:
+            # Encode the NumPy array directly with libjpeg-turbo
+            image_bytes = _tj.encode(arr, quality=save_options["quality"], pixel_format=TJPF_RGB)
+        else:
+            img_buffer = _get_encode_buffer()
+            Image.fromarray(arr).save(img_buffer, format=image_format, **save_options)
+            # Drop leftovers from a previous, larger image
+            img_buffer.truncate()
+            image_bytes = img_buffer.getvalue()
         
         return {
             "disease": disease,
             "confidence": confidence,
             "all_predictions": all_predictions,
-            "annotated_image": annotated_image_base64
+            "annotated_image_bytes": image_bytes,
+            "annotated_image_type": mime_type
         }
 
 
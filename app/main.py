@@ -2,34 +2,42 @@
 FastAPI application for Crop Doctor inference API.
 """
 
+import asyncio
+import functools
+import importlib.util
+import sys
 import tempfile
 import os
+import uuid
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException, status, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, status, Query, Request
 from typing import Optional, Dict
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
+from cachetools import TTLCache
 
-# Try to import inference module - handle case when ultralytics is not available
-try:
-    from app.inference import get_model
-    INFERENCE_AVAILABLE = True
-except ImportError as e:
-    INFERENCE_AVAILABLE = False
-    # Create a dummy function that will raise an error
-    def get_model():
-        raise ImportError(
-            "Ultralytics YOLOv8 is not installed. "
-            "This package requires Python 3.8 or higher.\n"
-            "Please upgrade Python and install: pip install -r requirements.txt"
-        )
-
-from app.schemas import PredictionResponse, ErrorResponse, TranslationRequest, TranslationResponse, SupportedLanguagesResponse
-from app.utils import validate_image, load_image_from_bytes, check_model_exists
+from app.schemas import PredictionItem, PredictionResponse, ErrorResponse, TranslationRequest, TranslationResponse, SupportedLanguagesResponse, construct_model
+from app.utils import decode_and_validate, encode_data_uri, check_model_exists
 from app.translator import get_translator
 
 
+# The inference stack (torch, ultralytics) is imported on first use so that
+# endpoints which don't need the model start fast (e.g. serverless cold starts)
+INFERENCE_AVAILABLE = importlib.util.find_spec("ultralytics") is not None
+
+
+def _lazy_get_model():
+    """
+    Get the global model instance, importing app.inference on first use.
+    
+    Returns:
+        ModelInference instance
+    """
+    from app.inference import get_model
+    return get_model()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Crop Doctor API",
@@ -37,6 +45,18 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Micro-batching: concurrent /predict requests are coalesced into one model call
+MAX_BATCH = int(os.getenv("CROPDOCTOR_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("CROPDOCTOR_MAX_WAIT_MS", "15"))
+
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_worker_task: Optional[asyncio.Task] = None
+
+# Annotated images awaiting download: detection_id -> (image bytes, MIME type)
+# Kept per process for 5 minutes, so downloads only work when they reach the same
+# worker; multi-worker and serverless (Vercel) clients must use inline_image=true
+_annotated_images = TTLCache(maxsize=1024, ttl=300)
+
 # Add CORS middleware - allow all origins for maximum compatibility
 app.add_middleware(
     CORSMiddleware,
@@ -47,16 +67,81 @@ app.add_middleware(
 )
 
 
+async def batch_worker():
+    """
+    Collect queued prediction requests and run them through the model in batches.
+    
+    Waits for the first request, then gathers up to MAX_BATCH requests or until
+    MAX_WAIT_MS has elapsed, and resolves each request's future with its result.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        images, image_formats, futures = zip(*batch)
+        try:
+            model = _lazy_get_model()
+            # run_in_executor rather than asyncio.to_thread, which needs Python 3.9+
+            results = await loop.run_in_executor(
+                None, functools.partial(model.predict_batch, list(images), list(image_formats))
+            )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def ensure_batch_worker():
+    """Start the batch worker if it is not already running."""
+    global _batch_queue, _batch_worker_task
+    if _batch_worker_task is None or _batch_worker_task.done():
+        _batch_queue = asyncio.Queue()
+        _batch_worker_task = asyncio.create_task(batch_worker())
+
+
+async def run_prediction(image: Image.Image, image_format: str) -> Dict:
+    """
+    Queue an image for batched inference and wait for its result.
+    
+    Args:
+        image: PIL Image object
+        image_format: Encoding for the annotated image ("JPEG" or "WEBP")
+        
+    Returns:
+        Prediction result dictionary
+    """
+    ensure_batch_worker()
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((image, image_format, future))
+    return await future
+
+
 @app.on_event("startup")
 async def startup_event():
     """Load model once at application startup."""
+    ensure_batch_worker()
     try:
         if not check_model_exists():
             print("WARNING: Model file not found. Please train the model first.")
             print("The API will start but /predict endpoint will fail.")
         else:
-            # Load model at startup (not per request)
-            get_model()
+            # Load model at startup (not per request) and warm it up
+            model = _lazy_get_model()
+            model.warmup(runs=1)
             print("API started successfully!")
     except Exception as e:
         print(f"Error loading model at startup: {e}")
@@ -71,6 +156,7 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "predict": "POST /predict - Upload an image to detect plant diseases",
+            "predict_image": "GET /predict/{detection_id}/image - Download the annotated image",
             "health": "GET /health - Check API health status"
         }
     }
@@ -78,19 +164,18 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """
+    Health check endpoint.
+    
+    Reports whether the model is loaded without loading it, so health probes
+    stay cheap while startup is still importing and warming up the model.
+    """
     model_exists = check_model_exists()
-    model_loaded = False
     ultralytics_available = INFERENCE_AVAILABLE
-    error_message = None
+    error_message = None if ultralytics_available else "Ultralytics YOLOv8 not installed"
     
-    try:
-        get_model()
-        model_loaded = True
-    except ImportError as e:
-        error_message = str(e)
-    except Exception:
-        pass
+    inference_module = sys.modules.get("app.inference")
+    model_loaded = getattr(inference_module, "_model_instance", None) is not None
     
     return {
         "status": "healthy" if model_loaded else "degraded",
@@ -103,18 +188,23 @@ async def health_check():
 
 @app.post("/predict", response_model=PredictionResponse)
 async def predict_disease(
+    request: Request,
     file: UploadFile = File(...),
-    lang: Optional[str] = Query(None, description="Language code for translation (e.g., 'es', 'fr', 'hi')")
+    lang: Optional[str] = Query(None, description="Language code for translation (e.g., 'es', 'fr', 'hi')"),
+    inline_image: bool = Query(False, description="Also return the annotated image as a base64 data URI")
 ):
     """
     Predict plant disease from uploaded image.
     
     Args:
+        request: Incoming request (an Accept header with image/webp selects WebP output)
         file: Image file (multipart/form-data)
         lang: Optional language code for translation (e.g., "es", "fr", "hi")
+        inline_image: If True, include the annotated image as base64 in the response
         
     Returns:
-        PredictionResponse with disease detection results (translated if lang specified)
+        PredictionResponse with disease detection results (translated if lang specified).
+        The annotated image is available from GET /predict/{detection_id}/image.
     """
     print(f"[API] Received request with lang parameter: {lang}")
     
@@ -129,24 +219,27 @@ async def predict_disease(
         # Read file content
         file_content = await file.read()
         
-        # Validate image
-        is_valid, error_msg = validate_image(file_content)
-        if not is_valid:
+        # Validate and decode image in a single pass
+        try:
+            image = decode_and_validate(file_content)
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_msg
+                detail=str(e)
             )
         
-        # Load image
-        image = load_image_from_bytes(file_content)
+        # Run inference (batched with concurrent requests)
+        image_format = "WEBP" if "image/webp" in request.headers.get("accept", "") else "JPEG"
+        result = await run_prediction(image, image_format)
         
-        # Convert to RGB if necessary (handles RGBA, L, etc.)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        
-        # Run inference
-        model = get_model()
-        result = model.predict(image)
+        # Keep the annotated image for the binary download endpoint
+        image_bytes = result.pop("annotated_image_bytes")
+        image_type = result.pop("annotated_image_type")
+        detection_id = uuid.uuid4().hex
+        _annotated_images[detection_id] = (image_bytes, image_type)
+        result["detection_id"] = detection_id
+        if inline_image:
+            result["annotated_image"] = encode_data_uri(image_bytes, image_type)
         
         # Translate if language specified
         if lang and lang != "en":
@@ -155,20 +248,24 @@ async def predict_disease(
                 translator = get_translator()
                 original_disease = result.get('disease', 'N/A')
                 print(f"[TRANSLATION] Original disease: {original_disease}")
-                result = translator.translate_prediction_response(result, target_lang=lang)
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, translator.translate_prediction_response, result, lang
+                )
                 translated_disease = result.get('disease', 'N/A')
                 print(f"[TRANSLATION] Translated disease: {translated_disease}")
-            except ImportError as e:
-                print(f"[TRANSLATION ERROR] Library not installed: {e}")
-                print("[TRANSLATION ERROR] Run: pip install deep-translator")
             except Exception as e:
                 import traceback
                 print(f"[TRANSLATION ERROR] {type(e).__name__}: {e}")
                 traceback.print_exc()
                 # Continue with original English if translation fails
         
-        # Return response
-        return PredictionResponse(**result)
+        # Return response - all values are server-generated, so skip validation
+        # (translation returns predictions as plain dicts)
+        result["all_predictions"] = [
+            construct_model(PredictionItem, **pred) if isinstance(pred, dict) else pred
+            for pred in result["all_predictions"]
+        ]
+        return construct_model(PredictionResponse, **result)
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -190,6 +287,30 @@ async def predict_disease(
         )
 
 
+@app.get("/predict/{detection_id}/image")
+async def get_annotated_image(detection_id: str):
+    """
+    Download the annotated image for a previous prediction.
+    
+    Only the worker process that handled the prediction has the image, so this
+    returns 404 behind multiple workers or on serverless platforms.
+    
+    Args:
+        detection_id: ID returned by POST /predict
+        
+    Returns:
+        Annotated image as binary JPEG/WebP
+    """
+    cached = _annotated_images.get(detection_id)
+    if cached is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Annotated image not found or expired"
+        )
+    image_bytes, image_type = cached
+    return Response(content=image_bytes, media_type=image_type)
+
+
 @app.get("/languages", response_model=SupportedLanguagesResponse)
 async def get_supported_languages():
     """
@@ -216,10 +337,14 @@ async def translate_text(request: TranslationRequest):
     """
     try:
         translator = get_translator()
-        translated = translator.translate_text(
-            request.text,
-            target_lang=request.target_lang,
-            source_lang=request.source_lang
+        translated = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                translator.translate_text,
+                request.text,
+                target_lang=request.target_lang,
+                source_lang=request.source_lang
+            )
         )
         return {"translated_text": translated, "target_lang": request.target_lang}
     except Exception as e:
@@ -236,11 +361,12 @@ if __name__ == "__main__":
     # Disable reload on Windows to avoid subprocess issues
     use_reload = "--reload" in sys.argv and sys.platform != "win32"
     
-    # Run with uvicorn
+    # Run with uvicorn (uses uvloop/httptools automatically when installed)
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
         reload=use_reload  # Auto-reload disabled on Windows
     )
 
@@ -3,10 +3,31 @@ Pydantic schemas for API request/response models.
 Compatible with both Pydantic 1.x (Python 3.7) and 2.x (Python 3.8+).
 """
 
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Type, TypeVar
 from pydantic import BaseModel, Field
 
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def construct_model(model_cls: Type[ModelT], **values) -> ModelT:
+    """
+    Create a model instance without running validation.
+    
+    Only use this for trusted, server-generated data (e.g. model outputs).
+    
+    Args:
+        model_cls: Pydantic model class
+        **values: Field values
+        
+    Returns:
+        Model instance
+    """
+    # model_construct on Pydantic 2.x, construct on 1.x
+    construct = getattr(model_cls, "model_construct", None) or model_cls.construct
+    return construct(**values)
+
+
 class PredictionItem(BaseModel):
     """Individual prediction result."""
     class_name: str = Field(..., description="Detected disease class name")
@@ -21,9 +42,14 @@ class PredictionResponse(BaseModel):
         ..., 
         description="All detected diseases with confidence scores"
     )
-    annotated_image: str = Field(
-        ..., 
-        description="Base64-encoded annotated image with bounding boxes (data:image/png;base64,...)"
+    detection_id: Optional[str] = Field(
+        default=None,
+        description="ID for fetching the annotated image from GET /predict/{detection_id}/image"
+    )
+    annotated_image: Optional[str] = Field(
+        default=None,
+        description="Base64-encoded annotated image with bounding boxes, only included when inline_image=true "
+                    "(data:image/jpeg;base64,... or data:image/webp;base64,...)"
     )
 
 
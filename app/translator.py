@@ -3,8 +3,9 @@ Translation service for multi-language support.
 Uses deep-translator for reliable translations.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Optional
-from deep_translator import GoogleTranslator
 
 
 # Supported languages mapping
@@ -40,6 +41,9 @@ SUPPORTED_LANGUAGES = {
     "tl": "Filipino",
 }
 
+# Threads for translating a batch's strings concurrently (one request each)
+_translate_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="translate")
+
 
 class TranslationService:
     """Service for translating disease names and text."""
@@ -63,14 +67,80 @@ class TranslationService:
         if target_lang == "en" or target_lang == source_lang:
             return text
         
+        if not text:
+            return text
+        
         try:
-            translator = GoogleTranslator(source=source_lang, target=target_lang)
-            translated = translator.translate(text)
-            return translated
+            return self._translate_cached(text, target_lang, source_lang)
         except Exception as e:
             print(f"Translation error for '{text}': {e}")
             return text  # Return original text on error
     
+    @lru_cache(maxsize=4096)
+    def _translate_cached(self, text: str, target_lang: str, source_lang: str) -> str:
+        """
+        Translate text via Google Translate, memoizing results.
+        
+        Disease names come from a small fixed vocabulary, so repeated
+        predictions are served from the cache without a network call.
+        Failed translations raise and are therefore not cached.
+        
+        Args:
+            text: Text to translate
+            target_lang: Target language code
+            source_lang: Source language code
+            
+        Returns:
+            Translated text
+        """
+        # Imported on first use to keep deep_translator out of app startup
+        from deep_translator import GoogleTranslator
+        translator = GoogleTranslator(source=source_lang, target=target_lang)
+        return translator.translate(text)
+    
+    def translate_batch(self, texts: List[str], target_lang: str = "en", source_lang: str = "en") -> Dict[str, str]:
+        """
+        Translate several strings, translating each unique string once.
+        
+        Each string goes through the per-string cache, so only strings that
+        have not been translated before reach the network. Those requests are
+        made concurrently, so a batch costs about one round trip.
+        
+        Args:
+            texts: Texts to translate (duplicates are translated once)
+            target_lang: Target language code (default: "en")
+            source_lang: Source language code (default: "en")
+            
+        Returns:
+            Dictionary mapping each original text to its translation
+        """
+        unique = list(dict.fromkeys(texts))
+        translated = _translate_pool.map(
+            lambda text: self.translate_text(text, target_lang, source_lang),
+            unique
+        )
+        return dict(zip(unique, translated))
+    
+    @staticmethod
+    def _prediction_to_dict(pred) -> Dict:
+        """
+        Convert a prediction (Pydantic model or dict) to a new dictionary.
+        
+        Args:
+            pred: Prediction dictionary or Pydantic model with 'class_name' key
+            
+        Returns:
+            Prediction dictionary
+        """
+        if hasattr(pred, 'dict'):
+            return pred.dict()
+        elif hasattr(pred, 'model_dump'):
+            return pred.model_dump()
+        elif isinstance(pred, dict):
+            return pred.copy()
+        else:
+            return {"class_name": str(pred), "confidence": 0.0}
+    
     def translate_disease_names(self, predictions: List, target_lang: str = "en") -> List[Dict]:
         """
         Translate disease names in prediction results.
@@ -82,36 +152,17 @@ class TranslationService:
         Returns:
             List of prediction dictionaries with translated class names
         """
+        translated_predictions = [self._prediction_to_dict(pred) for pred in predictions]
         if target_lang == "en":
-            # Convert to dicts if needed
-            result = []
-            for pred in predictions:
-                if hasattr(pred, 'dict'):
-                    result.append(pred.dict())
-                elif hasattr(pred, 'model_dump'):
-                    result.append(pred.model_dump())
-                elif isinstance(pred, dict):
-                    result.append(pred)
-                else:
-                    result.append({"class_name": str(pred), "confidence": 0.0})
-            return result
-        
-        translated_predictions = []
-        for pred in predictions:
-            # Convert Pydantic model to dict if needed
-            if hasattr(pred, 'dict'):
-                pred_dict = pred.dict()
-            elif hasattr(pred, 'model_dump'):
-                pred_dict = pred.model_dump()
-            elif isinstance(pred, dict):
-                pred_dict = pred.copy()
-            else:
-                pred_dict = {"class_name": str(pred), "confidence": 0.0}
-            
+            return translated_predictions
+        
+        mapping = self.translate_batch(
+            [pred.get("class_name", "") for pred in translated_predictions],
+            target_lang=target_lang
+        )
+        for pred_dict in translated_predictions:
             original_name = pred_dict.get("class_name", "")
-            translated_name = self.translate_text(original_name, target_lang=target_lang)
-            pred_dict["class_name"] = translated_name
-            translated_predictions.append(pred_dict)
+            pred_dict["class_name"] = mapping.get(original_name, original_name)
         
         return translated_predictions
     
@@ -119,6 +170,10 @@ class TranslationService:
         """
         Translate entire prediction response.
         
+        The primary disease and all prediction class names are translated
+        together with translate_batch: each unique name once, uncached names
+        concurrently.
+        
         Args:
             response: Prediction response dictionary
             target_lang: Target language code (default: "en")
@@ -130,22 +185,30 @@ class TranslationService:
             return response
         
         translated_response = response.copy()
+        predictions = [
+            self._prediction_to_dict(pred)
+            for pred in translated_response.get("all_predictions", [])
+        ]
+        
+        # Translate each unique string once
+        texts = [pred.get("class_name", "") for pred in predictions]
+        if "disease" in translated_response:
+            texts.insert(0, translated_response["disease"])
+        mapping = self.translate_batch(texts, target_lang=target_lang)
         
         # Translate primary disease name
         if "disease" in translated_response:
             original_disease = translated_response["disease"]
-            translated_disease = self.translate_text(original_disease, target_lang=target_lang)
+            translated_disease = mapping.get(original_disease, original_disease)
             translated_response["disease"] = translated_disease
             print(f"[TRANSLATOR] '{original_disease}' -> '{translated_disease}' ({target_lang})")
         
         # Translate all predictions
         if "all_predictions" in translated_response:
-            predictions = translated_response["all_predictions"]
-            translated_predictions = self.translate_disease_names(
-                predictions,
-                target_lang=target_lang
-            )
-            translated_response["all_predictions"] = translated_predictions
+            for pred_dict in predictions:
+                original_name = pred_dict.get("class_name", "")
+                pred_dict["class_name"] = mapping.get(original_name, original_name)
+            translated_response["all_predictions"] = predictions
         
         return translated_response
     
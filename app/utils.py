@@ -3,51 +3,68 @@ Utility functions for image processing and validation.
 """
 
 import io
+import base64
 from pathlib import Path
-from typing import Tuple, Optional
 from PIL import Image
-import numpy as np
 
 
-def validate_image(file_content: bytes) -> Tuple[bool, Optional[str]]:
+# Uploaded images are downscaled to fit within this size before inference
+# (YOLO letterboxes to 640x640 anyway)
+MAX_IMAGE_SIZE = (1280, 1280)
+
+
+def decode_and_validate(file_content: bytes, max_bytes: int = 10 * 1024 * 1024) -> Image.Image:
     """
-    Validate uploaded image file.
+    Validate uploaded image bytes and decode them into an RGB PIL Image.
+    
+    The image is decoded only once and downscaled to fit MAX_IMAGE_SIZE;
+    for JPEGs libjpeg does most of the downscaling in the DCT domain
+    while decoding.
     
     Args:
         file_content: Raw bytes of the image file
+        max_bytes: Maximum allowed file size in bytes (default: 10MB)
         
     Returns:
-        Tuple of (is_valid, error_message)
+        Decoded RGB PIL Image object
+        
+    Raises:
+        ValueError: If the file is too large or is not a valid image
     """
+    # Check size first (prevent memory issues) - cheapest check
+    if len(file_content) > max_bytes:
+        raise ValueError(f"Image file is too large (max {max_bytes // (1024 * 1024)}MB)")
+    
     try:
-        # Try to open the image
         image = Image.open(io.BytesIO(file_content))
-        
-        # Verify it's a valid image format
-        image.verify()
-        
-        # Check if image is too large (prevent memory issues)
-        max_size = 10 * 1024 * 1024  # 10MB
-        if len(file_content) > max_size:
-            return False, "Image file is too large (max 10MB)"
-        
-        return True, None
-        
+        image.draft('RGB', MAX_IMAGE_SIZE)
+        # Decoding the pixel data validates the file
+        image.load()
     except Exception as e:
-        return False, f"Invalid image file: {str(e)}"
+        raise ValueError(f"Invalid image file: {str(e)}")
+    
+    # Finish the resize for non-JPEG formats (no-op if already small enough)
+    image.thumbnail(MAX_IMAGE_SIZE, Image.Resampling.BILINEAR)
+    
+    # Convert to RGB if necessary (handles RGBA, L, etc.)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    return image
 
 
-def load_image_from_bytes(file_content: bytes) -> Image.Image:
+def encode_data_uri(data: bytes, mime_type: str) -> str:
     """
-    Load PIL Image from bytes.
+    Encode binary data as a base64 data URI.
     
     Args:
-        file_content: Raw bytes of the image file
+        data: Raw bytes (e.g. an encoded JPEG image)
+        mime_type: MIME type of the data (e.g. "image/jpeg")
         
     Returns:
-        PIL Image object
+        Data URI string (data:<mime_type>;base64,...)
     """
-    return Image.open(io.BytesIO(file_content))
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
 
 
 def get_model_path() -> Path:
@@ -3,6 +3,7 @@ Quick start script for the Crop Doctor API.
 Run this from the crop_doctor_api directory.
 """
 
+import os
 import uvicorn
 import sys
 
@@ -11,10 +12,13 @@ if __name__ == "__main__":
     # Set reload=True for development on Linux/macOS if needed
     use_reload = "--reload" in sys.argv and sys.platform != "win32"
     
+    # uvicorn's default loop/http ("auto") use uvloop and httptools when installed
+    # (uvicorn[standard]). Keep WEB_CONCURRENCY=1 on GPU so the model is loaded into VRAM only once
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
         reload=use_reload
     )
 
@@ -4,19 +4,197 @@ Trains a YOLOv8 model on plant disease detection dataset.
 """
 
 import argparse
+import logging
 import os
+import shutil
+import time
 from pathlib import Path
-from ultralytics import YOLO
-import torch
+
+log = logging.getLogger(__name__)
+
+# Pretrained YOLOv8 detection checkpoints accepted by --model
+PRETRAINED_MODELS = ["yolov8n.pt", "yolov8s.pt", "yolov8m.pt", "yolov8l.pt", "yolov8x.pt"]
+
+
+def load_data_config(data_yaml_path: Path) -> dict:
+    """
+    Parse and validate a dataset data.yaml file.
+    
+    Args:
+        data_yaml_path: Path to data.yaml
+        
+    Returns:
+        Parsed dataset configuration
+        
+    Raises:
+        ValueError: If the file is not a mapping or lacks 'train', 'val' or 'names'
+    """
+    import yaml  # installed with ultralytics
+    
+    # libyaml's C loader when available (much faster than the pure-Python one)
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    config = yaml.load(data_yaml_path.read_bytes(), Loader=loader)
+    
+    if not isinstance(config, dict):
+        raise ValueError(f"Invalid data.yaml (expected a mapping): {data_yaml_path}")
+    missing = [key for key in ("train", "val", "names") if key not in config]
+    if missing:
+        raise ValueError(f"data.yaml is missing required keys {missing}: {data_yaml_path}")
+    return config
+
+
+def choose_cache_mode(config: dict, data_yaml_path: Path, imgsz: int):
+    """
+    Pick the Ultralytics image cache mode for a dataset (used for --cache auto).
+    
+    The RAM cache holds decoded images resized to imgsz (uint8 HWC), which are
+    many times larger than the compressed files on disk, so the estimate is
+    image count x imgsz^2 x 3 bytes over the train/val splits. Disk caching is
+    never chosen automatically: it writes a decoded .npy next to every image.
+    
+    Args:
+        config: Parsed data.yaml (see load_data_config)
+        data_yaml_path: Path to data.yaml
+        imgsz: Training image size
+        
+    Returns:
+        'ram' if the decoded images fit in available memory (with a 50% safety margin), else False
+    """
+    import psutil  # installed with ultralytics
+    from ultralytics.data.utils import IMG_FORMATS
+    from ultralytics.utils import DATASETS_DIR
+    
+    # Resolve split paths the way Ultralytics' check_det_dataset does
+    root = Path(config.get("path") or data_yaml_path.resolve().parent)
+    if not root.is_absolute():
+        root = (DATASETS_DIR / root).resolve()
+    
+    image_count = 0
+    for split in ("train", "val"):
+        entries = config[split] if isinstance(config[split], list) else [config[split]]
+        for entry in entries:
+            split_path = (root / entry).resolve()
+            if not split_path.exists() and str(entry).startswith("../"):
+                split_path = (root / str(entry)[3:]).resolve()
+            if split_path.is_dir():
+                # os.walk only lists names, no per-file stat
+                image_count += sum(
+                    name.rpartition(".")[2].lower() in IMG_FORMATS
+                    for _, _, names in os.walk(split_path)
+                    for name in names
+                )
+            elif split_path.is_file():
+                # Text file listing one image path per line
+                with open(split_path) as f:
+                    image_count += sum(1 for line in f if line.strip())
+    
+    if image_count == 0:
+        log.warning("⚠ No images found for the train/val splits, image caching disabled")
+        return False
+    cache_bytes = image_count * imgsz * imgsz * 3 * 1.5
+    available = psutil.virtual_memory().available
+    if available > cache_bytes:
+        return "ram"
+    log.warning(
+        "⚠ Decoded images need ~%.1f GB RAM but only %.1f GB is available, image caching disabled "
+        "(--cache disk caches them as .npy files next to the images instead)",
+        cache_bytes / 1024**3, available / 1024**3
+    )
+    return False
+
+
+def add_profiler_callbacks(model, active_steps: int):
+    """
+    Record a torch.profiler trace of the first training steps.
+    
+    Skips one step, warms up for one, then records active_steps steps. The
+    trace is written in TensorBoard/Chrome format to <run dir>/tb_trace.
+    
+    Args:
+        model: Ultralytics YOLO model to attach the callbacks to
+        active_steps: Number of training steps to record
+    """
+    import torch
+    
+    state = {"profiler": None, "steps_left": 0}
+    
+    def start_profiler(trainer):
+        profiler = torch.profiler.profile(
+            schedule=torch.profiler.schedule(wait=1, warmup=1, active=active_steps),
+            on_trace_ready=torch.profiler.tensorboard_trace_handler(str(Path(trainer.save_dir) / "tb_trace")),
+            record_shapes=True
+        )
+        profiler.start()
+        state["profiler"] = profiler
+        state["steps_left"] = 2 + active_steps
+    
+    def step_profiler(trainer):
+        profiler = state["profiler"]
+        if profiler is None:
+            return
+        profiler.step()
+        state["steps_left"] -= 1
+        if state["steps_left"] == 0:
+            stop_profiler(trainer)
+    
+    def stop_profiler(trainer):
+        if state["profiler"] is not None:
+            state["profiler"].stop()
+            state["profiler"] = None
+    
+    model.add_callback("on_train_start", start_profiler)
+    model.add_callback("on_train_batch_end", step_profiler)
+    model.add_callback("on_train_end", stop_profiler)
+
+
+def find_resumable_checkpoint(runs_dir: Path):
+    """
+    Find the newest last.pt of a run that has not finished training.
+    
+    Ultralytics refuses to resume finished runs: their final last.pt is
+    stripped to epoch -1, and a run stopped right after its last epoch has
+    nothing left to train.
+    
+    Args:
+        runs_dir: Directory containing the run directories
+        
+    Returns:
+        (checkpoint path, the run's saved training arguments), or (None, None)
+        if no unfinished run exists
+    """
+    from ultralytics.nn.tasks import torch_safe_load
+    
+    candidates = sorted(runs_dir.glob("*/weights/last.pt"), key=os.path.getmtime, reverse=True)
+    for ckpt_path in candidates:
+        try:
+            ckpt, _ = torch_safe_load(str(ckpt_path))
+        except Exception as e:
+            log.warning("Skipping unreadable checkpoint %s: %s", ckpt_path, e)
+            continue
+        epoch = ckpt.get("epoch", -1)
+        train_args = ckpt.get("train_args") or {}
+        if epoch != -1 and epoch + 1 < train_args.get("epochs", 0):
+            return ckpt_path, train_args
+        log.info("Skipping finished run: %s", ckpt_path.parent.parent)
+    return None, None
 
 
 def train_model(
     data_yaml: str,
     epochs: int = 50,
-    batch: int = 16,
-    imgsz: int = 640,
+    batch: int = None,
+    imgsz: int = None,
     model_name: str = "yolov8n.pt",
-    output_dir: str = "../model"
+    output_dir: str = "../model",
+    amp: bool = True,
+    workers: int = None,
+    cache: str = "auto",
+    compile_model: bool = False,
+    channels_last: bool = True,
+    resume: bool = False,
+    device: str = None,
+    val_interval: int = 1,
+    profile_steps: int = 0
 ):
     """
     Train YOLOv8 model on plant disease dataset.
@@ -24,11 +202,28 @@ def train_model(
     Args:
         data_yaml: Path to data.yaml file (from Roboflow dataset)
         epochs: Number of training epochs
-        batch: Batch size
-        imgsz: Image size for training
+        batch: Batch size. -1 lets Ultralytics pick it to fit ~60% of GPU memory.
+            If None, -1 for a new run or the checkpoint's batch when resuming.
+        imgsz: Image size for training. If None, 640 for a new run or the checkpoint's
+            imgsz when resuming.
         model_name: Pretrained model name (yolov8n.pt, yolov8s.pt, etc.)
         output_dir: Directory to save the best model
+        amp: Use automatic mixed precision (FP16 autocast, FP32 master weights)
+        workers: Number of dataloader workers. If None, uses the CPU count (max 16).
+        cache: Image cache: "auto" (RAM when the decoded images fit, else none), "ram", "disk" or "off"
+        compile_model: Compile the network with torch.compile (mode="reduce-overhead")
+        channels_last: Use NHWC (channels_last) memory format for the network
+        resume: Resume the most recent unfinished run from its last.pt checkpoint.
+            The run keeps its saved arguments (device, workers, cache, amp, ...);
+            only an explicit imgsz or batch overrides them.
+        device: Device(s) to train on, e.g. "0", "0,1", "cpu" or "mps". If None, uses all GPUs (DDP when >1).
+            DDP runs without callbacks, so compile_model, val_interval and profile_steps are rejected there.
+        val_interval: Validate every N epochs (the final epoch is always validated)
+        profile_steps: If > 0, record a torch.profiler trace of this many training steps
     """
+    if val_interval < 1:
+        raise ValueError(f"val_interval must be at least 1, got {val_interval}")
+    
     # Convert to Path objects for easier handling
     data_yaml_path = Path(data_yaml)
     output_path = Path(output_dir)
@@ -36,68 +231,283 @@ def train_model(
     # Validate data.yaml exists
     if not data_yaml_path.exists():
         raise FileNotFoundError(f"data.yaml not found at: {data_yaml_path}")
+    data_yaml_str = str(data_yaml_path.resolve())
+    
+    # Validate data.yaml contents before paying for the heavy imports below
+    data_config = load_data_config(data_yaml_path)
+    
+    # Heavy imports (torch, ultralytics) are deferred so --help and argument
+    # errors return immediately
+    import torch
+    from ultralytics import YOLO
+    
+    # Expandable allocator segments avoid fragmentation-driven memory creep across epochs.
+    # Must be set before the first CUDA allocation.
+    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
     
     # Create output directory if it doesn't exist
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Check GPU availability
-    device = 0 if torch.cuda.is_available() else 'cpu'
-    if torch.cuda.is_available():
-        print(f"✓ CUDA available! Using GPU: {torch.cuda.get_device_name(0)}")
-        print(f"  GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
+    # Every run gets its own directory under <output parent>/runs
+    runs_dir = output_path.parent / "runs"
+    
+    # Resuming loads the run's last.pt directly instead of the pretrained weights.
+    # Ultralytics restores the run's saved arguments from the checkpoint and only
+    # lets imgsz and batch be overridden, so the device comes from there too.
+    last_ckpt_path = None
+    if resume:
+        last_ckpt_path, ckpt_args = find_resumable_checkpoint(runs_dir)
+        if last_ckpt_path is None:
+            log.warning("⚠ No unfinished run found to resume from, starting a new run")
+            resume = False
+        else:
+            if device is not None:
+                log.warning("⚠ --device is ignored when resuming, the run continues on its device %s",
+                            ckpt_args.get("device"))
+            device = ckpt_args.get("device") or None
+    # Explicit values override a resumed run's imgsz/batch; otherwise use the defaults
+    imgsz_given, batch_given = imgsz is not None, batch is not None
+    if not resume:
+        imgsz = 640 if imgsz is None else imgsz
+        batch = -1 if batch is None else batch
+    
+    # Check GPU availability - use every visible GPU by default (DDP when more than one).
+    # device_count() does not create a CUDA context.
+    device_given = device is not None
+    if device is None:
+        gpu_count = torch.cuda.device_count()
+        device = ",".join(str(i) for i in range(gpu_count)) if gpu_count > 0 else "cpu"
+    device = str(device)
+    # Numeric CUDA indices ("1", "0,1", "cuda:1"); anything else ("cpu", "mps") is
+    # passed through to Ultralytics untouched
+    device_ids = device.lower().replace("cuda:", "").replace(" ", "").split(",")
+    gpu_ids = device_ids if all(i.isdigit() for i in device_ids) else []
+    if gpu_ids and device_given:
+        # Ultralytics' select_device sets CUDA_VISIBLE_DEVICES only when training
+        # starts, which has no effect once the warmup below has created a CUDA
+        # context, so restrict visibility to the requested GPUs here first
+        os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(gpu_ids)
+    
+    if len(gpu_ids) > 1:
+        # Ultralytics runs DDP in a generated script that only receives the train()
+        # arguments: callbacks and in-process torch settings are not carried over
+        unsupported = [
+            flag for flag, enabled in (
+                ("--compile", compile_model),
+                ("--val-interval", val_interval > 1),
+                ("--profile-steps", profile_steps > 0)
+            ) if enabled
+        ]
+        if unsupported:
+            raise ValueError(
+                f"{', '.join(unsupported)} cannot be used with multi-GPU (DDP) training. "
+                "Select a single GPU with --device, e.g. --device 0"
+            )
+        if channels_last:
+            log.info("channels_last is not applied in multi-GPU (DDP) training")
+            channels_last = False
+        # Ultralytics has no AutoBatch under DDP and would substitute batch 16,
+        # which fails unless it divides evenly across the GPUs
+        if batch is not None and batch < 0:
+            batch = len(gpu_ids) * max(16 // len(gpu_ids), 1)
+            log.warning("⚠ Auto-batch is not supported with multi-GPU (DDP) training, using batch size %d "
+                        "(pass --batch to choose)", batch)
+        # Visibility is already restricted to the selected GPUs, so cuda:i is gpu_ids[i]
+        log.info(
+            "✓ CUDA available! Using %d GPUs with DDP (cuDNN benchmark and TF32 left at their defaults):\n%s",
+            len(gpu_ids),
+            "\n".join(
+                f"  [{gpu_id}] {torch.cuda.get_device_name(i)} - "
+                f"{torch.cuda.get_device_properties(i).total_memory / 1024**3:.2f} GB"
+                for i, gpu_id in enumerate(gpu_ids)
+            )
+        )
+    elif gpu_ids and torch.cuda.is_available():
+        # The selected GPU is visible as cuda:0 from here on
+        log.info(
+            "✓ CUDA available! Using GPU %s: %s - %.2f GB",
+            gpu_ids[0],
+            torch.cuda.get_device_name(0),
+            torch.cuda.get_device_properties(0).total_memory / 1024**3
+        )
+        
+        # Create the CUDA context and allocator pool now rather than in the first training step
+        torch.zeros(1, device=0).add_(1)
+        torch.cuda.synchronize(0)
+        
+        # Ampere+ GPUs: allow TF32 tensor-core math for the FP32 ops AMP leaves in FP32
+        if torch.cuda.get_device_capability(0)[0] >= 8:
+            torch.set_float32_matmul_precision("high")
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        
+        # Auto-batch probing is unreliable on small GPUs; use a safe fixed batch there
+        if batch is not None and batch < 0:
+            free_memory, _ = torch.cuda.mem_get_info(0)
+            if free_memory < 4 * 1024**3:
+                log.warning("Only %.2f GB GPU memory free, using batch size 4 instead of auto-batch",
+                            free_memory / 1024**3)
+                batch = 4
+    elif device == "cpu":
+        log.warning("⚠ CUDA not available. Training on CPU (will be slow!)")
+    
+    # Keep the GPU fed: dataloader workers and decoded-image cache
+    # (a resumed run keeps its own settings)
+    if not resume:
+        if workers is None:
+            workers = min(os.cpu_count() or 8, 16)
+        if cache == "auto":
+            cache = choose_cache_mode(data_config, data_yaml_path, imgsz)
+        elif cache == "off":
+            cache = False
+    
+    log.info("Loading %s: %s", "checkpoint" if resume else "pretrained model", last_ckpt_path or model_name)
+    # Load pretrained YOLOv8 model (or the checkpoint being resumed)
+    model = YOLO(str(last_ckpt_path or model_name))
+    
+    # imgsz is fixed, so cuDNN's per-shape kernel autotuning is done once and reused.
+    # Enabled only once training starts: AutoBatch (batch=-1) runs during trainer
+    # setup and falls back to batch 16 while cudnn.benchmark is on.
+    def enable_cudnn_benchmark(trainer):
+        torch.backends.cudnn.benchmark = True
+    
+    model.add_callback("on_train_start", enable_cudnn_benchmark)
+    
+    if val_interval > 1 or resume:
+        # Ultralytics validates after an epoch when args.val is set (and always
+        # on the final epoch), so toggle it to skip the epochs in between.
+        # A resumed run restores args.val from its checkpoint, so it is always
+        # scheduled from val_interval there.
+        # Clear the previous epoch's fitness on skipped epochs: save_model would
+        # otherwise overwrite best.pt with unvalidated weights and EarlyStopping
+        # would count a stale score. Ultralytics still sets it if it validates anyway.
+        def schedule_validation(trainer):
+            trainer.args.val = (trainer.epoch + 1) % val_interval == 0
+            if not trainer.args.val:
+                trainer.fitness = None
+        
+        model.add_callback("on_train_epoch_end", schedule_validation)
+    
+    if profile_steps > 0:
+        add_profiler_callbacks(model, profile_steps)
+    
+    if channels_last:
+        # NHWC is the layout tensor-core conv kernels want; applied to the
+        # trainer's network, which is rebuilt from the loaded weights
+        def to_channels_last(trainer):
+            trainer.model.to(memory_format=torch.channels_last)
+        
+        model.add_callback("on_train_start", to_channels_last)
+    
+    if compile_model:
+        # The trainer builds its own copy of the network, so compile its forward
+        # pass (CUDA graphs cut per-kernel launch overhead). Only forward is
+        # swapped: the module itself, its state_dict keys (used by ModelEMA) and
+        # the saved checkpoints stay the plain model. The compiled forward is
+        # detached at the end of each epoch so save_model can pickle the module.
+        compiled = {}
+        
+        def compile_forward(trainer):
+            if "forward" not in compiled:
+                compiled["forward"] = torch.compile(trainer.model.forward, mode="reduce-overhead", fullgraph=False)
+            trainer.model.forward = compiled["forward"]
+        
+        def detach_compiled_forward(trainer):
+            vars(trainer.model).pop("forward", None)
+        
+        model.add_callback("on_train_epoch_start", compile_forward)
+        model.add_callback("on_train_epoch_end", detach_compiled_forward)
+    
+    if resume:
+        # Ultralytics restores every other argument from the checkpoint
+        resume_overrides = {}
+        if imgsz_given:
+            resume_overrides["imgsz"] = imgsz
+        if batch_given:
+            resume_overrides["batch"] = batch
+        log.info(
+            "Resuming training from %s with its saved arguments:\n"
+            "  - Image size: %s\n"
+            "  - Batch size: %s\n"
+            "  - Device: %s",
+            last_ckpt_path,
+            resume_overrides.get("imgsz", ckpt_args.get("imgsz")),
+            resume_overrides.get("batch", ckpt_args.get("batch")),
+            device
+        )
+        results = model.train(resume=True, **resume_overrides)
     else:
-        print("⚠ CUDA not available. Training on CPU (will be slow!)")
-    
-    print(f"\nLoading pretrained model: {model_name}")
-    # Load pretrained YOLOv8 model
-    model = YOLO(model_name)
-    
-    print(f"\nStarting training with:")
-    print(f"  - Data: {data_yaml_path}")
-    print(f"  - Epochs: {epochs}")
-    print(f"  - Batch size: {batch}")
-    print(f"  - Image size: {imgsz}")
-    print(f"  - Device: {'GPU (CUDA)' if device == 0 else 'CPU'}")
-    print(f"  - Output directory: {output_path.absolute()}")
-    
-    # Train the model with explicit device specification
-    results = model.train(
-        data=str(data_yaml_path),
-        epochs=epochs,
-        batch=batch,
-        imgsz=imgsz,
-        device=device,  # Explicitly set device (0 for GPU, 'cpu' for CPU)
-        project=str(output_path.parent),
-        name="runs",
-        exist_ok=True,
-        save=True,
-        verbose=True
-    )
+        log.info(
+            "Starting training with:\n"
+            "  - Data: %s\n"
+            "  - Epochs: %s\n"
+            "  - Batch size: %s\n"
+            "  - Image size: %s\n"
+            "  - Device: %s\n"
+            "  - Mixed precision (AMP): %s\n"
+            "  - Dataloader workers: %s\n"
+            "  - Image cache: %s\n"
+            "  - torch.compile: %s\n"
+            "  - channels_last: %s\n"
+            "  - Validation interval: every %s epoch(s)\n"
+            "  - Output directory: %s",
+            data_yaml_str,
+            epochs,
+            "auto" if batch < 0 else batch,
+            imgsz,
+            f"GPU (CUDA {device})" if gpu_ids else device.upper(),
+            amp,
+            workers,
+            cache or "off",
+            compile_model,
+            channels_last,
+            val_interval,
+            output_path.absolute()
+        )
+        
+        # Unique run directory per invocation so concurrent trainings never share one
+        run_name = f"train-{int(time.time())}-{os.getpid()}"
+        
+        # Train the model with explicit device specification
+        results = model.train(
+            data=data_yaml_str,
+            epochs=epochs,
+            batch=batch,
+            imgsz=imgsz,
+            device=device,  # Explicitly set device ("0", "0,1,..." for GPUs, 'cpu' for CPU)
+            project=str(runs_dir),
+            name=run_name,
+            exist_ok=False,
+            amp=amp,
+            val=val_interval == 1,
+            deterministic=False,  # Let cuDNN pick the fastest (non-reproducible) algorithms
+            workers=workers,
+            cache=cache,
+            save=True,
+            verbose=True
+        )
     
     # Copy best.pt to model directory
-    # The best model is saved in runs/train/weights/best.pt
-    runs_dir = output_path.parent / "runs" / "train"
-    best_model_path = None
-    
-    # Find the latest training run
-    if runs_dir.exists():
-        train_dirs = sorted([d for d in runs_dir.iterdir() if d.is_dir()], 
-                           key=lambda x: x.stat().st_mtime, reverse=True)
-        if train_dirs:
-            weights_dir = train_dirs[0] / "weights"
-            best_model = weights_dir / "best.pt"
-            if best_model.exists():
-                best_model_path = best_model
-    
-    if best_model_path and best_model_path.exists():
-        import shutil
+    # The trainer knows exactly where this run saved its weights
+    best_model_path = Path(model.trainer.save_dir) / "weights" / "best.pt"
+    
+    if best_model_path.exists():
         target_path = output_path / "best.pt"
-        print(f"\nCopying best model to: {target_path}")
-        shutil.copy2(best_model_path, target_path)
-        print(f"Training complete! Best model saved to: {target_path.absolute()}")
+        log.info("Copying best model to: %s", target_path)
+        # Stage next to the target, then rename: readers never see a partial best.pt
+        tmp_path = target_path.with_suffix(f".pt.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            # Hardlink is O(1) and uses no extra space on the same filesystem
+            os.link(best_model_path, tmp_path)
+        except OSError:
+            # Cross-device: kernel-side copy (sendfile/copy_file_range)
+            shutil.copyfile(best_model_path, tmp_path)
+        os.replace(tmp_path, target_path)  # Atomic on POSIX
+        log.info("Training complete! Best model saved to: %s", target_path.absolute())
     else:
-        print("\nWarning: Could not find best.pt in training runs.")
-        print("Please check the runs/train directory manually.")
+        log.warning("Could not find best.pt at: %s", best_model_path)
+        log.warning("Please check the training run directory manually.")
     
     return results
 
@@ -122,18 +532,19 @@ def main():
     parser.add_argument(
         "--batch",
         type=int,
-        default=16,
-        help="Batch size (default: 16)"
+        default=None,
+        help="Batch size, -1 for auto-batch based on GPU memory (default: -1, or the resumed run's batch)"
     )
     parser.add_argument(
         "--imgsz",
         type=int,
-        default=640,
-        help="Image size for training (default: 640)"
+        default=None,
+        help="Image size for training (default: 640, or the resumed run's imgsz)"
     )
     parser.add_argument(
         "--model",
         type=str,
+        choices=PRETRAINED_MODELS,
         default="yolov8n.pt",
         help="Pretrained model name (default: yolov8n.pt)"
     )
@@ -143,8 +554,77 @@ def main():
         default="../model",
         help="Output directory for best.pt (default: ../model)"
     )
+    parser.add_argument(
+        "--amp",
+        dest="amp",
+        action="store_true",
+        default=True,
+        help="Use automatic mixed precision training (default: enabled)"
+    )
+    parser.add_argument(
+        "--no-amp",
+        dest="amp",
+        action="store_false",
+        help="Disable automatic mixed precision (train in full FP32)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of dataloader workers (default: CPU count, max 16)"
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        choices=["auto", "ram", "disk", "off"],
+        default="auto",
+        help="Decoded-image cache: auto uses RAM when the dataset fits, else no cache; "
+             "disk writes a .npy next to every image (default: auto)"
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the model with torch.compile for lower kernel-launch overhead (default: off)"
+    )
+    parser.add_argument(
+        "--no-channels-last",
+        dest="channels_last",
+        action="store_false",
+        help="Keep the default NCHW memory format instead of channels_last"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the most recent unfinished training run from its last.pt with its saved settings "
+             "(only --imgsz and --batch override them)"
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default=None,
+        help='Device(s) to train on, e.g. "0", "0,1", "cpu" or "mps" (default: all available GPUs). '
+             'Multi-GPU (DDP) training does not support --compile, --val-interval or --profile-steps'
+    )
+    parser.add_argument(
+        "--val-interval",
+        type=int,
+        default=1,
+        help="Validate every N epochs; the final epoch is always validated (default: 1)"
+    )
+    parser.add_argument(
+        "--profile-steps",
+        type=int,
+        default=0,
+        help="Record a torch.profiler trace of N training steps to <run dir>/tb_trace (default: 0, off)"
+    )
     
     args = parser.parse_args()
+    if args.val_interval < 1:
+        parser.error("--val-interval must be at least 1")
+    
+    # Only the main process logs under DDP (RANK is -1 outside DDP)
+    if int(os.environ.get("RANK", -1)) in (-1, 0):
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
     
     try:
         train_model(
@@ -153,10 +633,19 @@ def main():
             batch=args.batch,
             imgsz=args.imgsz,
             model_name=args.model,
-            output_dir=args.output
+            output_dir=args.output,
+            amp=args.amp,
+            workers=args.workers,
+            cache=args.cache,
+            compile_model=args.compile,
+            channels_last=args.channels_last,
+            resume=args.resume,
+            device=args.device,
+            val_interval=args.val_interval,
+            profile_steps=args.profile_steps
         )
     except Exception as e:
-        print(f"Error during training: {e}")
+        log.error("Error during training: %s", e)
         raise
 
 